@@ -0,0 +1,52 @@
+"""Буфер журнала модерации: события копятся в памяти и пишутся в БД пачками."""
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+from data import insert_moderation_events
+
+log = logging.getLogger(__name__)
+
+# Предел буфера на случай недоступности БД; старые события отбрасываются
+_MAX_BUFFER = 10000
+
+_buffer: List[tuple] = []
+# Записи, для которых уже добавлено 'enqueued'; в БД повтор тоже не запишется
+_enqueued_seen: Dict[tuple, None] = {}
+
+
+def _utc_now() -> str:
+    # Формат совпадает с CURRENT_TIMESTAMP в SQLite
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def record(kind: str, item_id: int, action: str, admin_id: Optional[int] = None):
+    """Добавляет событие в буфер. kind: 'verification' | 'meet'."""
+    _buffer.append((kind, item_id, action, admin_id, _utc_now()))
+    if len(_buffer) > _MAX_BUFFER:
+        del _buffer[:len(_buffer) - _MAX_BUFFER]
+        log.warning("Буфер журнала модерации переполнен, старые события отброшены")
+
+
+def record_enqueued(kind: str, item_id: int):
+    """Отмечает момент, когда запись впервые замечена в очереди (повторы отбрасываются)."""
+    key = (kind, item_id)
+    if key in _enqueued_seen:
+        return
+    _enqueued_seen[key] = None
+    if len(_enqueued_seen) > _MAX_BUFFER:
+        del _enqueued_seen[next(iter(_enqueued_seen))]
+    record(kind, item_id, 'enqueued')
+
+
+async def flush():
+    """Записывает накопленные события; при ошибке возвращает их в буфер."""
+    global _buffer
+    if not _buffer:
+        return
+    batch, _buffer = _buffer, []
+    try:
+        await insert_moderation_events(batch)
+    except Exception as e:
+        log.error(f"Не удалось записать журнал модерации ({len(batch)} событий): {e}")
+        _buffer = (batch + _buffer)[-_MAX_BUFFER:]
@@ -0,0 +1,88 @@
+"""Компактный формат callback_data: действие, тип записи, id и короткая подпись.
+
+Пример: "m1:a:v:1234:Xk3q_Z" — 20 байт из 64 допустимых Telegram.
+"""
+import base64
+import datetime
+import hashlib
+import hmac
+import logging
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
+
+import config
+
+log = logging.getLogger(__name__)
+
+# Действия
+APPROVE = 'a'
+DECLINE = 'd'
+DECLINE_DUPLICATES = 'g'
+PAGE = 'p'  # id — номер страницы очереди
+
+# Типы записей
+VERIFICATION = 'v'
+MEET = 'm'
+
+_TAG_LENGTH = 6
+
+
+class ModCallback(CallbackData, prefix="m1"):
+    """Версия формата зашита в prefix: при изменении полей нужен новый prefix."""
+    action: str
+    kind: str
+    id: int
+    tag: str
+
+
+def _tag(action: str, kind: str, item_id: int) -> str:
+    digest = hmac.new(
+        config.BOT_TOKEN.encode(), f"{action}:{kind}:{item_id}".encode(), hashlib.sha256
+    ).digest()
+    return base64.urlsafe_b64encode(digest).decode()[:_TAG_LENGTH]
+
+
+def pack(action: str, kind: str, item_id: int) -> str:
+    return ModCallback(action=action, kind=kind, id=item_id, tag=_tag(action, kind, item_id)).pack()
+
+
+# Старый формат (mv_ok_{user_id}_{verification_id}, mm_ok_{task_id}) — для кнопок, уже отправленных
+# админам; принимается только до config.LEGACY_CALLBACKS_UNTIL
+_LEGACY = {
+    'mv_ok': (APPROVE, VERIFICATION, 3),
+    'mv_no': (DECLINE, VERIFICATION, 3),
+    'mm_ok': (APPROVE, MEET, 2),
+    'mm_no': (DECLINE, MEET, 2),
+}
+
+
+def unpack(data: Optional[str]) -> Optional[ModCallback]:
+    """Разбирает callback_data; None если данные некорректны или подпись не совпала."""
+    if not data:
+        return None
+    if data.startswith(ModCallback.__prefix__ + ModCallback.__separator__):
+        try:
+            cb = ModCallback.unpack(data)
+        except (ValueError, TypeError):
+            return None
+        if not hmac.compare_digest(cb.tag, _tag(cb.action, cb.kind, cb.id)):
+            return None
+        return cb
+
+    parts = data.split("_")
+    legacy = _LEGACY.get("_".join(parts[:2]))
+    if not legacy or not _legacy_allowed():
+        return None
+    action, kind, id_index = legacy
+    try:
+        item_id = int(parts[id_index])
+    except (ValueError, IndexError):
+        return None
+    log.warning(f"Принят callback старого формата без подписи: {data}")
+    return ModCallback(action=action, kind=kind, id=item_id, tag='')
+
+
+def _legacy_allowed() -> bool:
+    until = config.LEGACY_CALLBACKS_UNTIL
+    return until is not None and datetime.date.today() <= until
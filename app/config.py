@@ -1,6 +1,9 @@
+import datetime
 import os
 from dotenv import load_dotenv
 
+from phash import MAX_SUPPORTED_DISTANCE
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv("MOD_BOT_TOKEN")
@@ -11,6 +14,29 @@ DB_PATH = os.getenv("DB_PATH")
 # Интервал опроса БД в секундах (минимум 5)
 POLL_INTERVAL = max(5, int(os.getenv("POLL_INTERVAL", "30")))
 
+# Число процессов для вычисления перцептивных хешей фото верификаций
+HASH_WORKERS = max(1, int(os.getenv("HASH_WORKERS", "1")))
+# Порог расстояния Хэмминга (из 64 бит dHash), до которого фото считаются дублями.
+# Переснятый студенческий обычно отличается на 4–7 бит; больше 7 индекс не поддерживает.
+DUP_HASH_DISTANCE = min(max(0, int(os.getenv("DUP_HASH_DISTANCE", "7"))), MAX_SUPPORTED_DISTANCE)
+
+# Лимит записей в кэше каждой очереди pending; при превышении очередь читается из БД
+PENDING_CACHE_MAX = max(1, int(os.getenv("PENDING_CACHE_MAX", "500")))
+# Сверка кэша очередей с БД каждые N опросов
+PENDING_CACHE_CHECK_EVERY = max(1, int(os.getenv("PENDING_CACHE_CHECK_EVERY", "10")))
+
+# До этой даты (включительно) принимаются неподписанные callback_data старого формата
+# (mv_ok_..., mm_ok_...) с кнопок, отправленных до перехода на callbacks.ModCallback.
+# Пустое значение — старый формат не принимается. После даты настройку нужно удалить.
+_legacy_until = os.getenv("LEGACY_CALLBACKS_UNTIL", "2026-11-19").strip()
+LEGACY_CALLBACKS_UNTIL = datetime.date.fromisoformat(_legacy_until) if _legacy_until else None
+
+# Режим дайджеста: при очереди встреч больше DIGEST_THRESHOLD вместо сообщения на каждую
+# встречу админ получает одну сводку за окно DIGEST_WINDOW секунд. Обычный режим
+# возвращается, когда очередь сокращается до половины порога.
+DIGEST_THRESHOLD = max(1, int(os.getenv("DIGEST_THRESHOLD", "20")))
+DIGEST_WINDOW = max(POLL_INTERVAL, int(os.getenv("DIGEST_WINDOW", "600")))
+
 if not BOT_TOKEN:
     raise ValueError("MOD_BOT_TOKEN не задан в .env")
 if not RATING_BOT_TOKEN:
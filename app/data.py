@@ -1,43 +1,129 @@
 import aiosqlite
 import datetime
+import logging
 import math
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator
 
 import config
+from phash import split_hash, to_signed, hamming, CHUNKS
 
 DB_PATH = config.DB_PATH
 
+log = logging.getLogger(__name__)
 
-async def init_moderator_tables():
-    """Создаёт таблицы и колонки, необходимые для работы ModeratorBot."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Таблица запросов на верификацию
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS pending_verifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                photo_file_id TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                admin_notified INTEGER DEFAULT 0
-            )
-        ''')
 
-        # Новые колонки в meet_tasks (только если таблица уже существует)
-        async with db.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name='meet_tasks'"
-        ) as cursor:
-            meet_tasks_exists = await cursor.fetchone()
+async def _migrate_v1(db) -> bool:
+    """Таблица запросов на верификацию."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS pending_verifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            photo_file_id TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            admin_notified INTEGER DEFAULT 0
+        )
+    ''')
+    return True
 
-        if meet_tasks_exists:
-            async with db.execute("PRAGMA table_info(meet_tasks)") as cursor:
-                cols = {row[1] for row in await cursor.fetchall()}
-            if 'admin_notified' not in cols:
-                await db.execute('ALTER TABLE meet_tasks ADD COLUMN admin_notified INTEGER DEFAULT 0')
-            if 'video_file_id' not in cols:
-                await db.execute('ALTER TABLE meet_tasks ADD COLUMN video_file_id TEXT')
 
-        await db.commit()
+async def _migrate_v2(db) -> bool:
+    """Перцептивные хеши фото верификаций (multi-index: CHUNKS частей по CHUNK_BITS бит)."""
+    chunk_cols = ",\n".join(f"            h{i} INTEGER NOT NULL" for i in range(CHUNKS))
+    await db.execute(f'''
+        CREATE TABLE IF NOT EXISTS verification_hashes (
+            verification_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            phash INTEGER NOT NULL,
+{chunk_cols}
+        )
+    ''')
+    for i in range(CHUNKS):
+        await db.execute(
+            f'CREATE INDEX IF NOT EXISTS idx_verification_hashes_h{i} ON verification_hashes(h{i})'
+        )
+    return True
+
+
+async def _migrate_v3(db) -> bool:
+    """Журнал решений модерации (только добавление записей)."""
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS moderation_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            admin_id INTEGER,
+            enqueued_at TIMESTAMP,
+            notified_at TIMESTAMP,
+            event_at TIMESTAMP NOT NULL,
+            wait_seconds REAL
+        )
+    ''')
+    await db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_moderation_events_item ON moderation_events(kind, item_id, action)'
+    )
+    await db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_moderation_events_admin '
+        'ON moderation_events(admin_id, event_at, action) WHERE admin_id IS NOT NULL'
+    )
+    await db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_moderation_events_wait '
+        'ON moderation_events(kind, wait_seconds, event_at) WHERE wait_seconds IS NOT NULL'
+    )
+    return True
+
+
+async def _migrate_v4(db) -> bool:
+    """Колонки ModeratorBot в meet_tasks.
+
+    meet_tasks создаёт RatingBot; пока её нет, миграция откладывается. Поэтому она
+    последняя в списке и не блокирует миграции, не зависящие от RatingBot.
+    """
+    async with db.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name='meet_tasks'"
+    ) as cursor:
+        if not await cursor.fetchone():
+            return False
+
+    async with db.execute("PRAGMA table_info(meet_tasks)") as cursor:
+        cols = {row[1] for row in await cursor.fetchall()}
+    if 'admin_notified' not in cols:
+        await db.execute('ALTER TABLE meet_tasks ADD COLUMN admin_notified INTEGER DEFAULT 0')
+    if 'video_file_id' not in cols:
+        await db.execute('ALTER TABLE meet_tasks ADD COLUMN video_file_id TEXT')
+    return True
+
+
+# Миграции применяются по порядку; номер версии = индекс + 1.
+# PRAGMA user_version общей БД зарезервирован за ModeratorBot — RatingBot его не использует.
+_MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4]
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+
+async def init_moderator_tables() -> int:
+    """Приводит схему БД к SCHEMA_VERSION и возвращает итоговую версию.
+
+    Если версия актуальна, выполняется один PRAGMA без блокировки на запись.
+    Отложенные миграции повторяются при следующем вызове (фоновый опрос вызывает
+    функцию, пока версия меньше SCHEMA_VERSION).
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute('PRAGMA user_version') as cursor:
+            version = (await cursor.fetchone())[0]
+        if version >= SCHEMA_VERSION:
+            return version
+
+        for migration in _MIGRATIONS[version:]:
+            await db.execute('BEGIN IMMEDIATE')
+            if not await migration(db):
+                await db.rollback()
+                log.warning(f"Миграция схемы v{version + 1} отложена: нет нужных таблиц RatingBot")
+                break
+            version += 1
+            await db.execute(f'PRAGMA user_version = {version}')
+            await db.commit()
+    return version
 
 
 # ---------- Верификации ----------
@@ -53,12 +139,13 @@ async def get_new_pending_verifications() -> List[Dict]:
     return [{'id': r[0], 'user_id': r[1], 'photo_file_id': r[2], 'created_at': r[3], 'photo_path': r[4]} for r in rows]
 
 
-async def get_all_pending_verifications() -> List[Dict]:
-    """Все верификации со статусом pending."""
+async def get_all_pending_verifications(after_id: int = 0) -> List[Dict]:
+    """Все верификации со статусом pending (с id > after_id — для инкрементального обновления)."""
     async with aiosqlite.connect(DB_PATH) as db:
         async with db.execute(
             "SELECT id, user_id, photo_file_id, created_at, photo_path "
-            "FROM pending_verifications WHERE status = 'pending' ORDER BY created_at"
+            "FROM pending_verifications WHERE status = 'pending' AND id > ? ORDER BY created_at",
+            (after_id,)
         ) as cursor:
             rows = await cursor.fetchall()
     return [{'id': r[0], 'user_id': r[1], 'photo_file_id': r[2], 'created_at': r[3], 'photo_path': r[4]} for r in rows]
@@ -101,10 +188,69 @@ async def approve_verification(user_id: int, verification_id: int) -> bool:
     return True
 
 
-async def decline_verification(verification_id: int):
+async def decline_verification(verification_id: int) -> bool:
+    """Атомарно отклоняет верификацию. Возвращает False если уже обработана."""
     async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE pending_verifications SET status = 'declined' WHERE id = ?", (verification_id,))
+        await db.execute(
+            "UPDATE pending_verifications SET status = 'declined' WHERE id = ? AND status = 'pending'",
+            (verification_id,)
+        )
+        if db.total_changes == 0:
+            return False
         await db.commit()
+    return True
+
+
+# ---------- Хеши фото верификаций ----------
+
+_HASH_CHUNK_COLS = ", ".join(f"h{i}" for i in range(CHUNKS))
+
+
+async def save_verification_hash(verification_id: int, user_id: int, phash: int):
+    chunks = split_hash(phash)
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            f'INSERT OR REPLACE INTO verification_hashes (verification_id, user_id, phash, {_HASH_CHUNK_COLS}) '
+            f'VALUES (?, ?, ?, {", ".join("?" * CHUNKS)})',
+            (verification_id, user_id, to_signed(phash), *chunks)
+        )
+        await db.commit()
+
+
+async def find_similar_verifications(phash: int, exclude_id: Optional[int] = None) -> List[Dict]:
+    """Верификации с похожим фото (расстояние Хэмминга <= DUP_HASH_DISTANCE), ближайшие первыми."""
+    chunks = split_hash(phash)
+    async with aiosqlite.connect(DB_PATH) as db:
+        # Кандидаты по точному совпадению хотя бы одной части — каждое условие идёт по своему индексу
+        async with db.execute(
+            "SELECT h.verification_id, h.user_id, h.phash, v.status "
+            "FROM verification_hashes h JOIN pending_verifications v ON v.id = h.verification_id "
+            "WHERE " + " OR ".join(f"h.h{i} = ?" for i in range(CHUNKS)),
+            chunks
+        ) as cursor:
+            rows = await cursor.fetchall()
+    result = []
+    for verification_id, user_id, other, status in rows:
+        if verification_id == exclude_id:
+            continue
+        distance = hamming(phash, other)
+        if distance <= config.DUP_HASH_DISTANCE:
+            result.append({'id': verification_id, 'user_id': user_id, 'status': status, 'distance': distance})
+    result.sort(key=lambda r: (r['distance'], r['id']))
+    return result
+
+
+async def get_pending_duplicates(verification_id: int) -> List[Dict]:
+    """Ожидающие верификации с тем же фото, включая саму verification_id."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            'SELECT phash FROM verification_hashes WHERE verification_id = ?', (verification_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+    if not row:
+        return []
+    similar = await find_similar_verifications(row[0])
+    return [r for r in similar if r['status'] == 'pending']
 
 
 # ---------- Встречи ----------
@@ -124,12 +270,13 @@ async def get_new_meet_tasks_for_admin() -> List[Dict]:
     ]
 
 
-async def get_all_pending_meet_tasks() -> List[Dict]:
-    """Все встречи в статусе waiting_admin."""
+async def get_all_pending_meet_tasks(after_id: int = 0) -> List[Dict]:
+    """Все встречи в статусе waiting_admin (с id > after_id — для инкрементального обновления)."""
     async with aiosqlite.connect(DB_PATH) as db:
         async with db.execute(
             "SELECT id, user1_id, user2_id, initiator_id, institute, location, video_file_id, video_path "
-            "FROM meet_tasks WHERE status = 'waiting_admin' ORDER BY created_at"
+            "FROM meet_tasks WHERE status = 'waiting_admin' AND id > ? ORDER BY created_at",
+            (after_id,)
         ) as cursor:
             rows = await cursor.fetchall()
     return [
@@ -145,6 +292,13 @@ async def mark_meet_admin_notified(task_id: int):
         await db.commit()
 
 
+async def mark_meets_admin_notified(task_ids: List[int]):
+    """Отмечает пачку встреч как отправленных (дайджест)."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.executemany('UPDATE meet_tasks SET admin_notified = 1 WHERE id = ?', [(i,) for i in task_ids])
+        await db.commit()
+
+
 async def get_meet_task_by_id(task_id: int) -> Optional[Dict]:
     async with aiosqlite.connect(DB_PATH) as db:
         async with db.execute('SELECT * FROM meet_tasks WHERE id = ?', (task_id,)) as cursor:
@@ -233,6 +387,7 @@ async def decline_meet(task_id: int) -> Optional[Dict]:
 # ---------- Статистика ----------
 
 async def get_stats() -> Dict[str, Any]:
+    """Общая статистика без размеров очередей — их отдаёт кэш pending_cache."""
     async with aiosqlite.connect(DB_PATH) as db:
         async with db.execute('SELECT COUNT(*) FROM profiles') as cursor:
             total = (await cursor.fetchone())[0]
@@ -243,30 +398,48 @@ async def get_stats() -> Dict[str, Any]:
         async with db.execute("SELECT COUNT(*) FROM meet_tasks WHERE status = 'confirmed'") as cursor:
             meets_confirmed = (await cursor.fetchone())[0]
 
-        async with db.execute("SELECT COUNT(*) FROM meet_tasks WHERE status = 'waiting_admin'") as cursor:
-            meets_pending = (await cursor.fetchone())[0]
-
         async with db.execute("SELECT COUNT(*) FROM profiles WHERE verified = 1") as cursor:
             verified_count = (await cursor.fetchone())[0]
 
-        # pending_verifications может не существовать на старых версиях БД
-        try:
-            async with db.execute("SELECT COUNT(*) FROM pending_verifications WHERE status = 'pending'") as cursor:
-                verifications_pending = (await cursor.fetchone())[0]
-        except Exception:
-            verifications_pending = 0
-
     return {
         'total': total,
         'male': gender_stats.get('Парень', 0),
         'female': gender_stats.get('Девушка', 0),
         'meets_confirmed': meets_confirmed,
-        'meets_pending': meets_pending,
         'verified_count': verified_count,
-        'verifications_pending': verifications_pending,
     }
 
 
+async def get_pending_counts() -> Dict[str, int]:
+    """Размеры очередей pending в БД — для сверки с кэшем."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute("SELECT COUNT(*) FROM meet_tasks WHERE status = 'waiting_admin'") as cursor:
+            meets_pending = (await cursor.fetchone())[0]
+
+        # pending_verifications может не существовать на старых версиях БД
+        try:
+            async with db.execute("SELECT COUNT(*) FROM pending_verifications WHERE status = 'pending'") as cursor:
+                verifications_pending = (await cursor.fetchone())[0]
+        except Exception:
+            verifications_pending = 0
+
+    return {'meets': meets_pending, 'verifications': verifications_pending}
+
+
+async def get_pending_checksums() -> Dict[str, tuple]:
+    """(COUNT, SUM(id)) очередей pending — сверка набора записей в кэше, а не только размера."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(id), 0) FROM meet_tasks WHERE status = 'waiting_admin'"
+        ) as cursor:
+            meets = tuple(await cursor.fetchone())
+        async with db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(id), 0) FROM pending_verifications WHERE status = 'pending'"
+        ) as cursor:
+            verifications = tuple(await cursor.fetchone())
+    return {'meets': meets, 'verifications': verifications}
+
+
 async def get_all_profiles_with_rating() -> List[Dict]:
     async with aiosqlite.connect(DB_PATH) as db:
         async with db.execute(
@@ -281,6 +454,229 @@ async def get_all_profiles_with_rating() -> List[Dict]:
     return result
 
 
+# ---------- Журнал модерации ----------
+
+# Время постановки в очередь: верификация создаётся сразу в pending, а встреча попадает
+# в waiting_admin позже создания — для неё берётся первое событие 'enqueued'/'notified'
+_ENQUEUED_AT_SQL = {
+    'verification': "(SELECT created_at FROM pending_verifications WHERE id = ?)",
+    'meet': "(SELECT MIN(event_at) FROM moderation_events "
+            "WHERE kind = 'meet' AND item_id = ? AND action IN ('enqueued', 'notified'))",
+}
+
+
+async def insert_moderation_events(events: List[tuple]):
+    """Добавляет события (kind, item_id, action, admin_id, event_at) одной транзакцией.
+
+    Для решений сразу заполняются enqueued_at, notified_at (по более раннему событию
+    'notified') и wait_seconds. Повторное 'enqueued' для той же записи не добавляется.
+    """
+    async with aiosqlite.connect(DB_PATH) as db:
+        for kind, enqueued_sql in _ENQUEUED_AT_SQL.items():
+            rows = [(k, item_id, action, admin_id, event_at, item_id, k, item_id)
+                    for k, item_id, action, admin_id, event_at in events if k == kind]
+            if not rows:
+                continue
+            await db.executemany(
+                "INSERT INTO moderation_events "
+                "(kind, item_id, action, admin_id, event_at, enqueued_at, notified_at, wait_seconds) "
+                "SELECT kind, item_id, action, admin_id, event_at, enqueued_at, notified_at, "
+                "  CASE WHEN action NOT IN ('enqueued', 'notified') "
+                "    THEN ROUND((julianday(event_at) - julianday(enqueued_at)) * 86400, 1) END "
+                "FROM (SELECT ? AS kind, ? AS item_id, ? AS action, ? AS admin_id, ? AS event_at, "
+                f"  {enqueued_sql} AS enqueued_at, "
+                "  (SELECT MIN(event_at) FROM moderation_events "
+                "   WHERE kind = ? AND item_id = ? AND action = 'notified') AS notified_at) AS e "
+                "WHERE e.action != 'enqueued' OR NOT EXISTS ("
+                "  SELECT 1 FROM moderation_events m "
+                "  WHERE m.kind = e.kind AND m.item_id = e.item_id AND m.action = 'enqueued')",
+                rows
+            )
+        await db.commit()
+
+
+async def get_moderation_stats(since: str) -> Dict[str, Any]:
+    """Пропускная способность администраторов и p50/p95 времени до решения с момента since."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT admin_id, COUNT(*), SUM(action IN ('approved', 'confirmed')) "
+            "FROM moderation_events WHERE admin_id IS NOT NULL AND event_at >= ? "
+            "GROUP BY admin_id ORDER BY COUNT(*) DESC",
+            (since,)
+        ) as cursor:
+            admins = [
+                {'admin_id': r[0], 'decisions': r[1], 'approved': r[2], 'declined': r[1] - r[2]}
+                for r in await cursor.fetchall()
+            ]
+
+        wait = {}
+        for kind in _ENQUEUED_AT_SQL:
+            async with db.execute(
+                "SELECT COUNT(*) FROM moderation_events "
+                "WHERE kind = ? AND wait_seconds IS NOT NULL AND event_at >= ?",
+                (kind, since)
+            ) as cursor:
+                count = (await cursor.fetchone())[0]
+            stats = {'count': count, 'p50': None, 'p95': None}
+            # Перцентиль по ближайшему рангу: одна строка из индекса (kind, wait_seconds)
+            for name, q in (('p50', 0.5), ('p95', 0.95)):
+                if not count:
+                    break
+                async with db.execute(
+                    "SELECT wait_seconds FROM moderation_events "
+                    "WHERE kind = ? AND wait_seconds IS NOT NULL AND event_at >= ? "
+                    "ORDER BY wait_seconds LIMIT 1 OFFSET ?",
+                    (kind, since, max(math.ceil(q * count) - 1, 0))
+                ) as cursor:
+                    stats[name] = (await cursor.fetchone())[0]
+            wait[kind] = stats
+
+    return {'admins': admins, 'wait': wait}
+
+
+# ---------- Экспорт ----------
+
+EXPORT_COLUMNS = {
+    'profiles': [
+        'user_id', 'name', 'gender', 'rating', 'verified',
+        'meets_confirmed', 'verifications_approved', 'verifications_declined',
+    ],
+    'history': ['kind', 'id', 'user1_id', 'user2_id', 'status', 'created_at', 'institute'],
+}
+
+
+def _period_filter(column: str, date_from: Optional[str], date_to: Optional[str]) -> tuple:
+    """SQL-условие по периоду [date_from, date_to] (даты YYYY-MM-DD, обе границы включительно)."""
+    sql, params = '', []
+    if date_from:
+        sql += f' AND {column} >= ?'
+        params.append(date_from)
+    if date_to:
+        sql += f" AND {column} < date(?, '+1 day')"
+        params.append(date_to)
+    return sql, params
+
+
+async def _fill_profile_aggregates(db, date_from: Optional[str], date_to: Optional[str],
+                                   institute: Optional[str]):
+    """Считает встречи и решения по верификациям одним GROUP BY во временные таблицы.
+
+    Временные таблицы живут в temp-схеме соединения и не держат блокировку основной БД.
+    """
+    meet_sql, meet_params = _period_filter('m.created_at', date_from, date_to)
+    if institute:
+        meet_sql += ' AND m.institute = ?'
+        meet_params.append(institute)
+    verif_sql, verif_params = _period_filter('v.created_at', date_from, date_to)
+
+    await db.execute(
+        'CREATE TEMP TABLE export_meets (user_id INTEGER PRIMARY KEY, meets INTEGER NOT NULL)'
+    )
+    await db.execute(
+        "INSERT INTO export_meets (user_id, meets) SELECT user_id, COUNT(*) FROM ("
+        f"  SELECT m.user1_id AS user_id FROM meet_tasks m WHERE m.status = 'confirmed'{meet_sql} "
+        "  UNION ALL "
+        f"  SELECT m.user2_id FROM meet_tasks m WHERE m.status = 'confirmed'{meet_sql}"
+        ") GROUP BY user_id",
+        meet_params + meet_params
+    )
+    await db.execute(
+        'CREATE TEMP TABLE export_verifications '
+        '(user_id INTEGER PRIMARY KEY, approved INTEGER NOT NULL, declined INTEGER NOT NULL)'
+    )
+    await db.execute(
+        "INSERT INTO export_verifications (user_id, approved, declined) "
+        "SELECT v.user_id, SUM(v.status = 'approved'), SUM(v.status = 'declined') "
+        f"FROM pending_verifications v WHERE v.status IN ('approved', 'declined'){verif_sql} "
+        "GROUP BY v.user_id",
+        verif_params
+    )
+    if institute:
+        # Участники любых встреч в институте за период
+        await db.execute('CREATE TEMP TABLE export_institute_users (user_id INTEGER PRIMARY KEY)')
+        await db.execute(
+            "INSERT INTO export_institute_users (user_id) "
+            f"SELECT m.user1_id FROM meet_tasks m WHERE 1 = 1{meet_sql} "
+            "UNION "
+            f"SELECT m.user2_id FROM meet_tasks m WHERE 1 = 1{meet_sql}",
+            meet_params + meet_params
+        )
+    await db.commit()
+
+
+async def _keyset_pages(db, sql: str, params: list, key_index: int,
+                        batch_size: int) -> AsyncIterator[List[tuple]]:
+    """Читает запрос страницами по ключу (sql заканчивается на "> ? ORDER BY ключ LIMIT ?").
+
+    Каждая страница — отдельный короткий запрос, поэтому чтение основной БД не держит
+    блокировку, пока вызывающий пишет файл.
+    """
+    last = -1
+    while True:
+        async with db.execute(sql, params + [last, batch_size]) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            return
+        last = rows[-1][key_index]
+        yield rows
+        if len(rows) < batch_size:
+            return
+
+
+async def iter_export_rows(kind: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                           institute: Optional[str] = None, batch_size: int = 500) -> AsyncIterator[List[tuple]]:
+    """Отдаёт строки выгрузки пачками по batch_size в порядке EXPORT_COLUMNS[kind]."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        if kind == 'profiles':
+            await _fill_profile_aggregates(db, date_from, date_to, institute)
+            institute_join = (
+                ' JOIN export_institute_users eu ON eu.user_id = p.user_id' if institute else ''
+            )
+            pages = _keyset_pages(
+                db,
+                "SELECT p.user_id, p.name, p.gender, p.rating_sum, p.rating_weight, p.verified, "
+                "COALESCE(em.meets, 0), COALESCE(ev.approved, 0), COALESCE(ev.declined, 0) "
+                "FROM profiles p "
+                "LEFT JOIN export_meets em ON em.user_id = p.user_id "
+                f"LEFT JOIN export_verifications ev ON ev.user_id = p.user_id{institute_join} "
+                "WHERE p.user_id > ? ORDER BY p.user_id LIMIT ?",
+                [], 0, batch_size
+            )
+            async for rows in pages:
+                batch = []
+                for user_id, name, gender, r_sum, r_weight, verified, *counts in rows:
+                    rating = round(r_sum / r_weight, 2) if r_weight and r_weight > 0 else 1.0
+                    batch.append((user_id, name, gender, max(rating, 1.0), verified, *counts))
+                yield batch
+            return
+
+        # История решений: у верификаций нет института, при фильтре по институту — только встречи
+        meet_sql, meet_params = _period_filter('m.created_at', date_from, date_to)
+        if institute:
+            meet_sql += ' AND m.institute = ?'
+            meet_params.append(institute)
+        async for rows in _keyset_pages(
+            db,
+            "SELECT 'meet', m.id, m.user1_id, m.user2_id, m.status, m.created_at, m.institute "
+            f"FROM meet_tasks m WHERE m.status IN ('confirmed', 'declined'){meet_sql} "
+            "AND m.id > ? ORDER BY m.id LIMIT ?",
+            meet_params, 1, batch_size
+        ):
+            yield rows
+        if institute:
+            return
+
+        verif_sql, verif_params = _period_filter('v.created_at', date_from, date_to)
+        async for rows in _keyset_pages(
+            db,
+            "SELECT 'verification', v.id, v.user_id, NULL, v.status, v.created_at, NULL "
+            f"FROM pending_verifications v WHERE v.status IN ('approved', 'declined'){verif_sql} "
+            "AND v.id > ? ORDER BY v.id LIMIT ?",
+            verif_params, 1, batch_size
+        ):
+            yield rows
+
+
 async def get_username(bot, user_id: int) -> str:
     try:
         chat = await bot.get_chat(user_id)
@@ -0,0 +1,47 @@
+"""Потоковая выгрузка статистики и истории модерации в сжатый CSV/NDJSON файл."""
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from typing import Optional
+
+from data import EXPORT_COLUMNS, iter_export_rows
+
+EXPORT_FORMATS = ('csv', 'json')
+
+
+async def write_export(kind: str, fmt: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                       institute: Optional[str] = None) -> tuple:
+    """Пишет выгрузку во временный .gz файл и возвращает (путь, число строк).
+
+    Строки читаются из БД пачками и сразу пишутся на диск, поэтому расход памяти
+    не зависит от размера таблиц. Удалить файл после отправки должен вызывающий.
+    """
+    columns = EXPORT_COLUMNS[kind]
+    suffix = '.csv.gz' if fmt == 'csv' else '.ndjson.gz'
+    fd, path = tempfile.mkstemp(prefix=f'export_{kind}_', suffix=suffix)
+    os.close(fd)
+
+    count = 0
+    try:
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+            if fmt == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                write_batch = writer.writerows
+            else:
+                def write_batch(batch):
+                    f.writelines(
+                        json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in batch
+                    )
+
+            async for batch in iter_export_rows(kind, date_from, date_to, institute):
+                # Сжатие и запись — в потоке, чтобы не блокировать обработку апдейтов
+                await asyncio.to_thread(write_batch, batch)
+                count += len(batch)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
@@ -1,20 +1,24 @@
+import datetime
 import html
 import logging
 import os
 
 from aiogram import Router, F, Bot
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery, FSInputFile
 
+import audit
+import callbacks
 import config
+import pending_cache
 from data import (
     get_stats, get_all_profiles_with_rating, get_username,
-    get_all_pending_verifications, get_user_id_by_verification,
-    approve_verification, decline_verification,
-    get_all_pending_meet_tasks,
-    confirm_meet, decline_meet,
+    get_user_id_by_verification,
+    approve_verification, decline_verification, get_pending_duplicates,
+    confirm_meet, decline_meet, get_moderation_stats,
 )
-from keyboards import get_admin_keyboard, get_verify_keyboard, get_meet_keyboard
+from export import EXPORT_FORMATS, write_export
+from keyboards import get_admin_keyboard, get_verify_keyboard, get_meet_keyboard, get_meet_page_keyboard
 
 # Базовые каталоги для медиафайлов (защита от path traversal)
 _DB_DIR = os.path.dirname(os.path.abspath(config.DB_PATH))
@@ -56,6 +60,7 @@ async def cmd_stats(message: Message, bot: Bot):
         return
 
     stats = await get_stats()
+    stats.update(await pending_cache.get_counts())
     profiles = await get_all_profiles_with_rating()
 
     lines_male = []
@@ -106,7 +111,7 @@ async def cmd_verifications(message: Message):
     if not is_admin(message.from_user.id):
         return
 
-    items = await get_all_pending_verifications()
+    items = await pending_cache.verifications.items()
     if not items:
         await message.answer("Нет ожидающих верификаций.")
         return
@@ -119,23 +124,11 @@ async def cmd_verifications(message: Message):
         await message.answer_photo(
             photo=photo,
             caption=f"Верификация #{item['id']}\nПользователь: {item['user_id']}\nВремя: {item['created_at']}",
-            reply_markup=get_verify_keyboard(item['user_id'], item['id']),
+            reply_markup=get_verify_keyboard(item['id']),
         )
 
 
-@router.callback_query(F.data.startswith("mv_ok_"))
-async def cb_verify_approve(callback: CallbackQuery, rating_bot: Bot):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав.", show_alert=True)
-        return
-
-    parts = callback.data.split("_")
-    try:
-        verification_id = int(parts[3])
-    except (ValueError, IndexError):
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
-
+async def cb_verify_approve(callback: CallbackQuery, verification_id: int, rating_bot: Bot):
     # Получаем user_id из БД — не доверяем callback_data
     user_id = await get_user_id_by_verification(verification_id)
     if not user_id:
@@ -143,9 +136,11 @@ async def cb_verify_approve(callback: CallbackQuery, rating_bot: Bot):
         return
 
     approved = await approve_verification(user_id, verification_id)
+    pending_cache.verifications.discard(verification_id)
     if not approved:
         await callback.answer("Уже обработано.", show_alert=True)
         return
+    audit.record('verification', verification_id, 'approved', callback.from_user.id)
 
     try:
         await rating_bot.send_message(user_id, "Ваша верификация одобрена! Вы получили значок верификации.")
@@ -156,26 +151,18 @@ async def cb_verify_approve(callback: CallbackQuery, rating_bot: Bot):
     await callback.answer("Пользователь верифицирован.")
 
 
-@router.callback_query(F.data.startswith("mv_no_"))
-async def cb_verify_decline(callback: CallbackQuery, rating_bot: Bot):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав.", show_alert=True)
-        return
-
-    parts = callback.data.split("_")
-    try:
-        verification_id = int(parts[3])
-    except (ValueError, IndexError):
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
-
+async def cb_verify_decline(callback: CallbackQuery, verification_id: int, rating_bot: Bot):
     # Получаем user_id из БД — не доверяем callback_data
     user_id = await get_user_id_by_verification(verification_id)
     if not user_id:
         await callback.answer("Верификация не найдена.", show_alert=True)
         return
 
-    await decline_verification(verification_id)
+    if not await decline_verification(verification_id):
+        await callback.answer("Уже обработано.", show_alert=True)
+        return
+    pending_cache.verifications.discard(verification_id)
+    audit.record('verification', verification_id, 'declined', callback.from_user.id)
 
     try:
         await rating_bot.send_message(
@@ -189,20 +176,60 @@ async def cb_verify_decline(callback: CallbackQuery, rating_bot: Bot):
     await callback.answer("Верификация отклонена.")
 
 
+async def cb_verify_decline_duplicates(callback: CallbackQuery, verification_id: int, rating_bot: Bot):
+    duplicates = await get_pending_duplicates(verification_id)
+    if not duplicates:
+        await callback.answer("Ожидающих дублей не найдено.", show_alert=True)
+        return
+
+    notified = set()
+    declined = 0
+    for dup in duplicates:
+        # Другой администратор мог уже решить эту верификацию
+        if not await decline_verification(dup['id']):
+            continue
+        declined += 1
+        pending_cache.verifications.discard(dup['id'])
+        audit.record('verification', dup['id'], 'declined', callback.from_user.id)
+        if dup['user_id'] in notified:
+            continue
+        notified.add(dup['user_id'])
+        try:
+            await rating_bot.send_message(
+                dup['user_id'],
+                "Ваш запрос на верификацию отклонён: это фото уже присылалось. "
+                "Попробуйте снова с более чётким фото студенческого билета."
+            )
+        except Exception as e:
+            log.warning(f"Не удалось уведомить {dup['user_id']}: {e}")
+
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.answer(f"Отклонено дублей: {declined}.")
+
+
 # ---------- Встречи на проверке ----------
 
+_MEET_PAGE_SIZE = 5
+
+
 @router.message(F.text == "Встречи на проверке")
 async def cmd_pending_meets(message: Message):
     if not is_admin(message.from_user.id):
         return
 
-    tasks = await get_all_pending_meet_tasks()
+    await _send_meet_page(message, 0)
+
+
+async def _send_meet_page(message: Message, page: int):
+    """Отправляет страницу очереди встреч: не больше _MEET_PAGE_SIZE карточек за раз."""
+    tasks = await pending_cache.meets.items()
     if not tasks:
         await message.answer("Нет встреч на проверке.")
         return
 
-    await message.answer(f"Встреч на проверке: {len(tasks)}")
-    for task in tasks:
+    pages = (len(tasks) + _MEET_PAGE_SIZE - 1) // _MEET_PAGE_SIZE
+    page = min(max(page, 0), pages - 1)
+    for task in tasks[page * _MEET_PAGE_SIZE:(page + 1) * _MEET_PAGE_SIZE]:
         caption = (
             f"Встреча #{task['id']}\n"
             f"Участники: {task['user1_id']} и {task['user2_id']}\n"
@@ -222,24 +249,25 @@ async def cmd_pending_meets(message: Message):
             caption += "\n(видео не прикреплено)"
         await message.answer(caption, reply_markup=get_meet_keyboard(task['id']))
 
+    await message.answer(
+        f"Встреч на проверке: {len(tasks)} (страница {page + 1} из {pages})",
+        reply_markup=get_meet_page_keyboard(page, pages),
+    )
 
-@router.callback_query(F.data.startswith("mm_ok_"))
-async def cb_meet_confirm(callback: CallbackQuery, rating_bot: Bot):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав.", show_alert=True)
-        return
 
-    try:
-        task_id = int(callback.data.split("_")[2])
-    except (ValueError, IndexError):
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
+async def cb_meet_page(callback: CallbackQuery, page: int, rating_bot: Bot):
+    await callback.answer()
+    await _send_meet_page(callback.message, page)
+
 
+async def cb_meet_confirm(callback: CallbackQuery, task_id: int, rating_bot: Bot):
     result = await confirm_meet(task_id)
+    pending_cache.meets.discard(task_id)
 
     if not result:
         await callback.answer("Задание не найдено или уже обработано.", show_alert=True)
         return
+    audit.record('meet', task_id, 'confirmed', callback.from_user.id)
 
     bonus = f" (x{result['multiplier']} — {result['season_name']})" if result['season_name'] else ""
     text = f"Ваша встреча подтверждена! +{result['points']} очков{bonus}"
@@ -263,23 +291,14 @@ async def cb_meet_confirm(callback: CallbackQuery, rating_bot: Bot):
     await callback.answer("Встреча подтверждена, очки начислены.")
 
 
-@router.callback_query(F.data.startswith("mm_no_"))
-async def cb_meet_decline(callback: CallbackQuery, rating_bot: Bot):
-    if not is_admin(callback.from_user.id):
-        await callback.answer("Нет прав.", show_alert=True)
-        return
-
-    try:
-        task_id = int(callback.data.split("_")[2])
-    except (ValueError, IndexError):
-        await callback.answer("Некорректные данные.", show_alert=True)
-        return
-
+async def cb_meet_decline(callback: CallbackQuery, task_id: int, rating_bot: Bot):
     result = await decline_meet(task_id)
+    pending_cache.meets.discard(task_id)
 
     if not result:
         await callback.answer("Задание не найдено или уже обработано.", show_alert=True)
         return
+    audit.record('meet', task_id, 'declined', callback.from_user.id)
 
     try:
         await rating_bot.send_message(result['user1_id'], "Ваша встреча не подтверждена администратором. Очки не начислены.")
@@ -303,6 +322,145 @@ async def cb_meet_decline(callback: CallbackQuery, rating_bot: Bot):
     await callback.answer("Встреча отклонена.")
 
 
+# ---------- Диспетчеризация callback-кнопок ----------
+
+_CALLBACK_HANDLERS = {
+    (callbacks.VERIFICATION, callbacks.APPROVE): cb_verify_approve,
+    (callbacks.VERIFICATION, callbacks.DECLINE): cb_verify_decline,
+    (callbacks.VERIFICATION, callbacks.DECLINE_DUPLICATES): cb_verify_decline_duplicates,
+    (callbacks.MEET, callbacks.APPROVE): cb_meet_confirm,
+    (callbacks.MEET, callbacks.DECLINE): cb_meet_decline,
+    (callbacks.MEET, callbacks.PAGE): cb_meet_page,
+}
+
+
+@router.callback_query()
+async def cb_dispatch(callback: CallbackQuery, rating_bot: Bot):
+    """Единая точка входа для inline-кнопок: разбор callback_data и поиск обработчика в таблице."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Нет прав.", show_alert=True)
+        return
+
+    data = callbacks.unpack(callback.data)
+    handler = _CALLBACK_HANDLERS.get((data.kind, data.action)) if data else None
+    if not handler:
+        await callback.answer("Некорректные данные.", show_alert=True)
+        return
+    await handler(callback, data.id, rating_bot)
+
+
+# ---------- Журнал модерации ----------
+
+_MODERATION_STATS_DAYS = 7
+
+
+def _format_wait(seconds: float | None) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < 60:
+        return f"{int(seconds)} с"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+@router.message(F.text == "Модерация")
+async def cmd_moderation_stats(message: Message, bot: Bot):
+    if not is_admin(message.from_user.id):
+        return
+
+    await audit.flush()
+    since = (
+        datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=_MODERATION_STATS_DAYS)
+    ).strftime('%Y-%m-%d %H:%M:%S')
+    stats = await get_moderation_stats(since)
+
+    text = f"Модерация за {_MODERATION_STATS_DAYS} дней\n\nРешения администраторов:\n"
+    if not stats['admins']:
+        text += "нет решений\n"
+    for a in stats['admins']:
+        username = await get_username(bot, a['admin_id'])
+        text += (
+            f"{html.escape(username)}: {a['decisions']} "
+            f"(одобрено {a['approved']}, отклонено {a['declined']})\n"
+        )
+
+    text += "\nВремя от подачи до решения:\n"
+    for kind, title in (('verification', "Верификации"), ('meet', "Встречи")):
+        w = stats['wait'][kind]
+        text += f"{title}: {w['count']} шт., p50 {_format_wait(w['p50'])}, p95 {_format_wait(w['p95'])}\n"
+
+    await message.answer(text)
+
+
+# ---------- Экспорт ----------
+
+_EXPORT_USAGE = (
+    "Использование: /export profiles|history [csv|json] [ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]] [institute=Название]\n"
+    "Пример: /export profiles csv 2026-09-01 2026-12-31 institute=ИКНТ"
+)
+
+
+def _parse_export_args(args: str) -> dict | None:
+    """Разбирает аргументы /export; None если аргументы некорректны."""
+    institute = None
+    if 'institute=' in args:
+        args, institute = args.split('institute=', 1)
+        institute = institute.strip() or None
+
+    tokens = args.split()
+    if not tokens or tokens[0] not in ('profiles', 'history'):
+        return None
+    result = {'kind': tokens[0], 'fmt': 'csv', 'date_from': None, 'date_to': None, 'institute': institute}
+    dates = []
+    for token in tokens[1:]:
+        if token in EXPORT_FORMATS:
+            result['fmt'] = token
+            continue
+        try:
+            dates.append(datetime.date.fromisoformat(token).isoformat())
+        except ValueError:
+            return None
+    if len(dates) > 2:
+        return None
+    if dates:
+        result['date_from'] = dates[0]
+    if len(dates) == 2:
+        result['date_to'] = dates[1]
+    return result
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+
+    params = _parse_export_args(command.args or "")
+    if not params:
+        await message.answer(_EXPORT_USAGE)
+        return
+
+    await message.answer("Готовлю выгрузку...")
+    kind, fmt = params.pop('kind'), params.pop('fmt')
+    try:
+        path, count = await write_export(kind, fmt, **params)
+    except Exception as e:
+        log.error(f"Не удалось подготовить выгрузку {kind} ({params}): {e}")
+        await message.answer("Не удалось подготовить выгрузку. Попробуйте позже.")
+        return
+    extension = 'csv.gz' if fmt == 'csv' else 'ndjson.gz'
+    try:
+        await message.answer_document(
+            FSInputFile(path, filename=f"{kind}_{datetime.date.today().isoformat()}.{extension}"),
+            caption=f"Выгрузка {kind}: {count} строк",
+        )
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            log.warning(f"Не удалось удалить временный файл {path}: {e}")
+
+
 # ---------- Утилиты ----------
 
 def _split_text(text: str, limit: int = 4096):
@@ -3,38 +3,61 @@ from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
 )
 
+from callbacks import pack, APPROVE, DECLINE, DECLINE_DUPLICATES, PAGE, VERIFICATION, MEET
+
 
 def get_admin_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="Статистика"), KeyboardButton(text="Верификации")],
-            [KeyboardButton(text="Встречи на проверке")],
+            [KeyboardButton(text="Встречи на проверке"), KeyboardButton(text="Модерация")],
         ],
         resize_keyboard=True,
     )
 
 
-def get_verify_keyboard(user_id: int, verification_id: int) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[[
+def get_verify_keyboard(verification_id: int, has_duplicates: bool = False) -> InlineKeyboardMarkup:
+    rows = [[
         InlineKeyboardButton(
             text="✅ Одобрить",
-            callback_data=f"mv_ok_{user_id}_{verification_id}"
+            callback_data=pack(APPROVE, VERIFICATION, verification_id)
         ),
         InlineKeyboardButton(
             text="❌ Отклонить",
-            callback_data=f"mv_no_{user_id}_{verification_id}"
+            callback_data=pack(DECLINE, VERIFICATION, verification_id)
         ),
-    ]])
+    ]]
+    if has_duplicates:
+        rows.append([InlineKeyboardButton(
+            text="🗑 Отклонить все дубли",
+            callback_data=pack(DECLINE_DUPLICATES, VERIFICATION, verification_id)
+        )])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
 def get_meet_keyboard(task_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(
             text="✅ Подтвердить",
-            callback_data=f"mm_ok_{task_id}"
+            callback_data=pack(APPROVE, MEET, task_id)
         ),
         InlineKeyboardButton(
             text="❌ Отклонить",
-            callback_data=f"mm_no_{task_id}"
+            callback_data=pack(DECLINE, MEET, task_id)
         ),
     ]])
+
+
+def get_meet_digest_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="📋 Открыть очередь", callback_data=pack(PAGE, MEET, 0)),
+    ]])
+
+
+def get_meet_page_keyboard(page: int, pages: int) -> InlineKeyboardMarkup | None:
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=pack(PAGE, MEET, page - 1)))
+    if page + 1 < pages:
+        buttons.append(InlineKeyboardButton(text="Далее ▶️", callback_data=pack(PAGE, MEET, page + 1)))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
@@ -1,4 +1,9 @@
+import time
+
+_T_START = time.perf_counter()
+
 import asyncio
+import html
 import logging
 import os
 
@@ -8,14 +13,20 @@ from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import FSInputFile
 
+import audit
 import config
+import pending_cache
 from data import (
-    init_moderator_tables,
+    init_moderator_tables, SCHEMA_VERSION,
     get_new_pending_verifications, mark_verification_notified,
-    get_new_meet_tasks_for_admin, mark_meet_admin_notified,
+    save_verification_hash, find_similar_verifications,
+    get_new_meet_tasks_for_admin, mark_meet_admin_notified, mark_meets_admin_notified,
 )
 from handlers import router
-from keyboards import get_verify_keyboard, get_meet_keyboard
+from keyboards import get_verify_keyboard, get_meet_keyboard, get_meet_digest_keyboard
+from phash import compute_dhash
+
+_T_IMPORTED = time.perf_counter()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,20 +34,102 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+_schema_version = 0  # Версия схемы после последней попытки миграции
+
 
 async def notify_admins(bot: Bot):
     """Фоновая задача: периодически проверяет новые запросы и уведомляет администраторов."""
+    global _schema_version
+    first_poll = True
     while True:
         try:
+            if _schema_version < SCHEMA_VERSION:
+                _schema_version = await init_moderator_tables()
             await _send_new_verifications(bot)
             await _send_new_meet_tasks(bot)
+            await pending_cache.refresh()
         except Exception as e:
             log.error(f"Ошибка в фоновом опросе: {e}")
+        else:
+            if first_poll:
+                first_poll = False
+                log.info(f"Первый опрос завершён через {_ms_since(_T_START)} мс после запуска процесса.")
+        finally:
+            # Журнал модерации пишется независимо от успеха уведомлений
+            await audit.flush()
         await asyncio.sleep(config.POLL_INTERVAL)
 
 
+_hash_pool = None  # Пул процессов для хеширования фото, создаётся при первой верификации
+
+
+def _get_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: fork из процесса с работающими потоками aiosqlite небезопасен
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=config.HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _hash_pool
+
+
+async def _hash_photos(paths: dict) -> dict:
+    """Хеширует фото {verification_id: путь} параллельно в пуле процессов.
+
+    Возвращает {verification_id: хеш}; фото, которые не удалось обработать, пропускаются.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    global _hash_pool
+    if not paths:
+        return {}
+    loop = asyncio.get_running_loop()
+    pool = _get_hash_pool()
+    ids = list(paths)
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, compute_dhash, paths[i]) for i in ids),
+        return_exceptions=True,
+    )
+    hashes = {}
+    broken = False
+    for verification_id, result in zip(ids, results):
+        if isinstance(result, BrokenProcessPool):
+            broken = True
+        elif isinstance(result, Exception):
+            log.warning(f"Не удалось вычислить хеш фото верификации #{verification_id}: {result}")
+        elif result is None:
+            log.warning(f"Фото верификации #{verification_id} не удалось прочитать для хеширования")
+        else:
+            hashes[verification_id] = result
+    if broken and _hash_pool is pool:
+        # Воркер упал (например, OOM на огромном фото) — пересоздаём пул при следующем опросе
+        log.warning("Пул хеширования фото сломан, будет пересоздан")
+        pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+    return hashes
+
+
+async def _find_duplicates(item: dict, phash: int) -> list:
+    """Сохраняет хеш фото верификации и возвращает похожие ранее присланные."""
+    # Поиск дублей — необязательное дополнение: ошибка БД не должна мешать отправке фото
+    try:
+        await save_verification_hash(item['id'], item['user_id'], phash)
+        return await find_similar_verifications(phash, exclude_id=item['id'])
+    except Exception as e:
+        log.warning(f"Не удалось проверить дубли фото верификации #{item['id']}: {e}")
+        return []
+
+
 async def _send_new_verifications(bot: Bot):
     items = await get_new_pending_verifications()
+    pending_cache.verifications.add(items)
+    # Все фото отправляются в пул сразу, чтобы HASH_WORKERS процессов работали параллельно
+    hashes = await _hash_photos({
+        item['id']: item['photo_path'] for item in items
+        if item.get('photo_path') and os.path.exists(item['photo_path'])
+    })
     for item in items:
         caption = (
             f"Новый запрос на верификацию #{item['id']}\n"
@@ -45,12 +138,22 @@ async def _send_new_verifications(bot: Bot):
         )
         # Используем файл с диска, т.к. file_id от другого бота не работает
         photo_path = item.get('photo_path')
+        duplicates = []
         if photo_path and os.path.exists(photo_path):
             photo = FSInputFile(photo_path)
+            if item['id'] in hashes:
+                duplicates = await _find_duplicates(item, hashes[item['id']])
         else:
             photo = item['photo_file_id']
             log.warning(f"Фото для верификации #{item['id']} не найдено на диске, используем file_id (может не сработать)")
 
+        declined = [d['id'] for d in duplicates if d['status'] == 'declined']
+        pending = [d['id'] for d in duplicates if d['status'] == 'pending']
+        if declined:
+            caption += "\n⚠️ Похоже на отклонённые: " + ", ".join(f"#{i}" for i in declined[:5])
+        if pending:
+            caption += "\n⚠️ Дубли в очереди: " + ", ".join(f"#{i}" for i in pending[:5])
+
         sent = False
         for admin_id in config.ADMIN_IDS:
             try:
@@ -58,7 +161,7 @@ async def _send_new_verifications(bot: Bot):
                     admin_id,
                     photo=photo,
                     caption=caption,
-                    reply_markup=get_verify_keyboard(item['user_id'], item['id']),
+                    reply_markup=get_verify_keyboard(item['id'], has_duplicates=bool(pending)),
                 )
                 sent = True
             except TelegramRetryAfter as e:
@@ -69,10 +172,70 @@ async def _send_new_verifications(bot: Bot):
             await asyncio.sleep(0.05)
         if sent:
             await mark_verification_notified(item['id'])
+            audit.record('verification', item['id'], 'notified')
+
+
+_digest_mode = False
+_last_digest_at = None  # loop.time() последней сводки
+
+
+async def _update_digest_mode() -> bool:
+    """Включает дайджест при очереди выше порога и выключает, когда она сократилась вдвое."""
+    global _digest_mode
+    backlog = await pending_cache.meets.count()
+    if not _digest_mode and backlog > config.DIGEST_THRESHOLD:
+        _digest_mode = True
+        log.info(f"Встреч на проверке: {backlog} — включён режим дайджеста.")
+    elif _digest_mode and backlog <= config.DIGEST_THRESHOLD // 2:
+        _digest_mode = False
+        log.info(f"Встреч на проверке: {backlog} — возврат к уведомлениям по каждой встрече.")
+    return _digest_mode
+
+
+async def _send_meet_digest(bot: Bot, tasks: list):
+    """Одна сводка на администратора за окно DIGEST_WINDOW вместо сообщения на каждую встречу."""
+    global _last_digest_at
+    loop = asyncio.get_running_loop()
+    if not tasks or (_last_digest_at is not None and loop.time() - _last_digest_at < config.DIGEST_WINDOW):
+        return  # новые встречи остаются admin_notified = 0 и попадут в следующую сводку
+
+    by_institute = {}
+    for task in tasks:
+        by_institute[task['institute']] = by_institute.get(task['institute'], 0) + 1
+    top = sorted(by_institute.items(), key=lambda kv: -kv[1])[:10]
+    text = (
+        f"Сводка: новых встреч на проверке — {len(tasks)}\n"
+        f"Всего в очереди: {await pending_cache.meets.count()}\n\n"
+        + "\n".join(f"{html.escape(str(name))}: {count}" for name, count in top)
+    )
+
+    sent = False
+    for admin_id in config.ADMIN_IDS:
+        try:
+            await bot.send_message(admin_id, text, reply_markup=get_meet_digest_keyboard())
+            sent = True
+        except TelegramRetryAfter as e:
+            log.warning(f"Flood control: ждём {e.retry_after}с перед повторной отправкой сводки встреч")
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            log.warning(f"Не удалось отправить сводку встреч администратору {admin_id}: {e}")
+        await asyncio.sleep(0.05)
+    if sent:
+        _last_digest_at = loop.time()
+        await mark_meets_admin_notified([task['id'] for task in tasks])
+        for task in tasks:
+            audit.record('meet', task['id'], 'notified')
 
 
 async def _send_new_meet_tasks(bot: Bot):
     tasks = await get_new_meet_tasks_for_admin()
+    # Встреча может перейти в waiting_admin уже после high-water mark кэша
+    pending_cache.meets.add(tasks)
+    for task in tasks:
+        audit.record_enqueued('meet', task['id'])
+    if await _update_digest_mode():
+        await _send_meet_digest(bot, tasks)
+        return
     for task in tasks:
         caption = (
             f"Новая встреча на проверке #{task['id']}\n"
@@ -114,6 +277,7 @@ async def _send_new_meet_tasks(bot: Bot):
             await asyncio.sleep(0.05)
         if sent:
             await mark_meet_admin_notified(task['id'])
+            audit.record('meet', task['id'], 'notified')
 
 
 _bg_task = None  # Храним ссылку на задачу, чтобы GC её не собрал
@@ -125,9 +289,23 @@ async def _on_startup(bot: Bot):
     log.info("Фоновой опрос БД запущен.")
 
 
+async def _shutdown_hash_pool():
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ms_since(t: float) -> int:
+    return round((time.perf_counter() - t) * 1000)
+
+
 async def main():
-    await init_moderator_tables()
-    log.info("Таблицы модератора инициализированы.")
+    t_db = time.perf_counter()
+    global _schema_version
+    version = _schema_version = await init_moderator_tables()
+    log.info(
+        f"Схема БД модератора: v{version}. "
+        f"Импорт: {round((_T_IMPORTED - _T_START) * 1000)} мс, инициализация БД: {_ms_since(t_db)} мс."
+    )
 
     bot = Bot(
         token=config.BOT_TOKEN,
@@ -139,6 +317,8 @@ async def main():
     dp["rating_bot"] = rating_bot
     dp.startup.register(_on_startup)
     dp.shutdown.register(rating_bot.session.close)
+    dp.shutdown.register(_shutdown_hash_pool)
+    dp.shutdown.register(audit.flush)
 
     log.info("ModeratorBot запускается...")
     await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
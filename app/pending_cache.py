@@ -0,0 +1,123 @@
+"""Общий для фонового опроса и обработчиков кэш очередей pending (верификации и встречи).
+
+Опрос дочитывает новые записи по id > high-water mark, обработчики модерации удаляют
+решённые записи, а просмотр очередей и счётчики в статистике берутся из памяти.
+"""
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+import config
+from data import (
+    get_all_pending_verifications, get_all_pending_meet_tasks, get_pending_counts, get_pending_checksums,
+)
+
+log = logging.getLogger(__name__)
+
+
+class PendingQueue:
+    def __init__(self, name: str, loader: Callable[[int], Awaitable[List[Dict]]], max_items: int):
+        self.name = name
+        self._loader = loader
+        self._max_items = max_items
+        self._items: Dict[int, Dict] = {}
+        self._high_water = 0
+        self._valid = False
+        # Очередь больше лимита: читаем из БД, пока COUNT(*) не опустится до лимита
+        self._overflow = False
+        # Решённые id: не возвращаем их в кэш, если ответ БД был прочитан до решения
+        self._decided: Dict[int, None] = {}
+
+    async def refresh(self):
+        """Дочитывает новые записи; при невалидном кэше перезагружает очередь целиком."""
+        if not self._valid:
+            if self._overflow and await self.count() > self._max_items:
+                return
+            await self.items()
+            return
+        self.add(await self._loader(self._high_water))
+
+    def add(self, items: List[Dict]):
+        if not self._valid:
+            return
+        for item in items:
+            if item['id'] in self._decided:
+                continue
+            self._items[item['id']] = item
+            self._high_water = max(self._high_water, item['id'])
+        if len(self._items) > self._max_items:
+            log.warning(
+                f"Очередь {self.name}: {len(self._items)} записей превышает лимит кэша "
+                f"{self._max_items}, читаем из БД"
+            )
+            self.invalidate()
+            self._overflow = True
+
+    def discard(self, item_id: int):
+        """Убирает решённую запись из кэша."""
+        self._items.pop(item_id, None)
+        self._decided[item_id] = None
+        if len(self._decided) > self._max_items:
+            del self._decided[next(iter(self._decided))]
+
+    def invalidate(self):
+        self._items.clear()
+        self._valid = False
+
+    def check(self, db_count: int, db_id_sum: int) -> bool:
+        """Сверяет размер и сумму id кэша с БД; при расхождении сбрасывает кэш."""
+        if not self._valid:
+            return True
+        count, id_sum = len(self._items), sum(self._items)
+        if (count, id_sum) == (db_count, db_id_sum):
+            return True
+        log.warning(
+            f"Очередь {self.name}: в кэше {count} (сумма id {id_sum}), "
+            f"в БД {db_count} (сумма id {db_id_sum}) — перезагружаем"
+        )
+        self.invalidate()
+        return False
+
+    async def items(self) -> List[Dict]:
+        if not self._valid:
+            items = await self._loader(0)
+            if len(items) <= self._max_items:
+                self._valid = True
+                self._overflow = False
+                self._items.clear()
+                self._high_water = 0
+                self.add(items)
+            else:
+                self._overflow = True
+            return items
+        return [self._items[i] for i in sorted(self._items)]
+
+    async def count(self) -> int:
+        if not self._valid:
+            return (await get_pending_counts())[self.name]
+        return len(self._items)
+
+
+verifications = PendingQueue('verifications', get_all_pending_verifications, config.PENDING_CACHE_MAX)
+meets = PendingQueue('meets', get_all_pending_meet_tasks, config.PENDING_CACHE_MAX)
+
+_polls_since_check = 0
+
+
+async def refresh():
+    """Вызывается фоновым опросом: дочитывает очереди и периодически сверяет их с БД."""
+    global _polls_since_check
+    _polls_since_check += 1
+    if _polls_since_check >= config.PENDING_CACHE_CHECK_EVERY:
+        _polls_since_check = 0
+        checksums = await get_pending_checksums()
+        verifications.check(*checksums['verifications'])
+        meets.check(*checksums['meets'])
+    await verifications.refresh()
+    await meets.refresh()
+
+
+async def get_counts() -> Dict[str, int]:
+    return {
+        'verifications_pending': await verifications.count(),
+        'meets_pending': await meets.count(),
+    }
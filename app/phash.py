@@ -0,0 +1,48 @@
+"""Перцептивный хеш фото верификаций для поиска повторных отправок.
+
+Функции модуля выполняются в пуле процессов, поэтому не зависят от config и aiogram.
+"""
+from typing import Optional
+
+# dHash 8x8 = 64 бита, делится на 8 частей по 8 бит для multi-index поиска
+HASH_BITS = 64
+CHUNK_BITS = 8
+CHUNKS = HASH_BITS // CHUNK_BITS
+
+# По принципу Дирихле при расстоянии < CHUNKS хотя бы одна часть совпадает точно,
+# поэтому порог дубля (config.DUP_HASH_DISTANCE) не может быть больше этого значения
+MAX_SUPPORTED_DISTANCE = CHUNKS - 1
+
+
+def compute_dhash(path: str) -> Optional[int]:
+    """Возвращает 64-битный dHash изображения или None, если файл не читается."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def split_hash(value: int) -> list:
+    """Делит хеш на CHUNKS частей по CHUNK_BITS бит (для индексированных колонок)."""
+    mask = (1 << CHUNK_BITS) - 1
+    return [(value >> (i * CHUNK_BITS)) & mask for i in range(CHUNKS)]
+
+
+def to_signed(value: int) -> int:
+    """SQLite хранит INTEGER как знаковое 64-битное число."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << HASH_BITS) - 1)).count('1')
@@ -0,0 +1,86 @@
+"""Стоимость диспетчеризации одного callback через aiogram Router.
+
+Сравнивает старую схему (цепочка F.data.startswith + split) с новой
+(один обработчик, callbacks.unpack + поиск в таблице). Обработчики пустые,
+запросы к Telegram и БД не выполняются.
+
+Запуск из корня репозитория: python bench/bench_callback_dispatch.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+os.environ.setdefault("MOD_BOT_TOKEN", "123456:bench")
+os.environ.setdefault("RATING_BOT_TOKEN", "654321:bench")
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("DB_PATH", "bench.db")
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery, Update, User
+
+import callbacks
+
+N = 20000
+
+
+def _legacy_router() -> Router:
+    router = Router()
+
+    async def noop(callback: CallbackQuery):
+        int(callback.data.split("_")[2])
+
+    for prefix in ("mv_ok_", "mv_no_", "mm_ok_", "mm_no_"):
+        router.callback_query(F.data.startswith(prefix))(noop)
+    return router
+
+
+def _table_router() -> Router:
+    router = Router()
+    table = {
+        (kind, action): (lambda item_id: None)
+        for kind in (callbacks.VERIFICATION, callbacks.MEET)
+        for action in (callbacks.APPROVE, callbacks.DECLINE, callbacks.DECLINE_DUPLICATES)
+    }
+
+    @router.callback_query()
+    async def dispatch(callback: CallbackQuery):
+        data = callbacks.unpack(callback.data)
+        table[(data.kind, data.action)](data.id)
+
+    return router
+
+
+def _update(data: str) -> Update:
+    return Update(update_id=1, callback_query=CallbackQuery(
+        id="1", from_user=User(id=1, is_bot=False, first_name="admin"),
+        chat_instance="1", data=data,
+    ))
+
+
+async def _measure(router: Router, data: str) -> float:
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token=os.environ["MOD_BOT_TOKEN"])
+    update = _update(data)
+    await dp.feed_update(bot, update)  # прогрев
+    start = time.perf_counter()
+    for _ in range(N):
+        await dp.feed_update(bot, update)
+    elapsed = time.perf_counter() - start
+    await bot.session.close()
+    return elapsed / N * 1e6
+
+
+async def main():
+    # Худший случай старой схемы — последний фильтр в цепочке
+    legacy = await _measure(_legacy_router(), "mm_no_12345")
+    packed = callbacks.pack(callbacks.DECLINE, callbacks.MEET, 12345)
+    table = await _measure(_table_router(), packed)
+    print(f"startswith-цепочка: {legacy:.1f} мкс/callback  ({len('mm_no_12345')} байт)")
+    print(f"таблица + codec:    {table:.1f} мкс/callback  ({len(packed)} байт, {packed})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())